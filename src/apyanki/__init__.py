@@ -1,9 +1,26 @@
 """Package for interfacing and manipulating Anki decks"""
 
-from importlib.metadata import version
 import os
 
-__version__ = version("apyanki")
+# Note: This is only declared here, the value is looked up by __getattr__
+__version__: str
+
+
+def __getattr__(name: str) -> str:
+    """Look up the package version on first access
+
+    Note: Reading the package metadata is slow, and the version is only needed
+    for "apy --version".
+    """
+    if name == "__version__":
+        # pylint: disable=import-outside-toplevel
+        from importlib.metadata import version
+
+        package_version = version("apyanki")
+        globals()[name] = package_version
+        return package_version
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Reduce rust verbosity, unless already explicitly increased. Anki by default
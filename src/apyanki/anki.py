@@ -1,6 +1,9 @@
 """An Anki collection wrapper class."""
 
 from __future__ import annotations
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 import os
 from pathlib import Path
 import pickle
@@ -8,8 +11,16 @@ import sqlite3
 import tempfile
 import time
 from types import TracebackType
-from typing import Any, Generator, Optional, TYPE_CHECKING, Type
-
+from typing import Any, Generator, Optional, Sequence, Type
+
+from anki import latex
+from anki.cards import Card, CardId
+from anki.collection import Collection
+from anki.errors import DBError, NotFoundError
+from anki.models import NotetypeDict, NotetypeId
+from anki.notes import NoteId
+from anki.sync import SyncAuth
+from anki.utils import ids2str
 from click import Abort
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.table import Table
@@ -21,9 +32,9 @@ from apyanki.console import console
 from apyanki.note import Note, NoteData, markdown_file_to_notes
 from apyanki.utilities import cd, choose, edit_file, suppress_stdout
 
-if TYPE_CHECKING:
-    from anki.notes import NoteId
-    from anki.models import NotetypeDict
+
+# Names of the card types, indexed by card.type
+_CARD_TYPES = ["new", "learning", "review", "relearning"]
 
 
 class Anki:
@@ -50,12 +61,17 @@ class Anki:
         with suppress_stdout():
             self.today: int = self.col.sched.today
 
+        # Note: all_names_and_ids() avoids loading the full notetype/deck objects
         self.model_name_to_id: dict[str, int] = {
-            m["name"]: m["id"] for m in self.col.models.all()
+            m.name: m.id for m in self.col.models.all_names_and_ids()
         }
-        self.model_names = list(self.model_name_to_id.keys())
+        self.model_names = self.model_name_to_id.keys()
+        self._model_field_names: dict[int, tuple[str, ...]] = {}
+        self._current_model: Optional[NotetypeDict] = None
 
-        self.deck_name_to_id = {d["name"]: d["id"] for d in self.col.decks.all()}
+        self.deck_name_to_id: dict[str, int] = {
+            d.name: d.id for d in self.col.decks.all_names_and_ids()
+        }
         self.deck_names = self.deck_name_to_id.keys()
         self.n_decks: int = len(self.deck_names)
 
@@ -79,7 +95,8 @@ class Anki:
             console.print(f"path = {base_path.absolute()}")
             raise Abort()
 
-        # Load metadata and profiles from database
+        # Load metadata and the selected profile from database. Only the selected
+        # profile is unpickled, since the other profiles are not used.
         conn = sqlite3.connect(db_path)
         try:
             res = conn.execute(
@@ -87,52 +104,50 @@ class Anki:
             )
             self._meta = pickle.loads(res.fetchone()[0])
 
-            profiles = conn.execute(
-                "select name, cast(data as blob) from profiles where name != '_global'"
-            ).fetchall()
+            if self._profile_name is None:
+                profile_names = [
+                    name
+                    for (name,) in conn.execute(
+                        "select name from profiles where name != '_global'"
+                    )
+                ]
+                self._profile_name = self._meta.get(
+                    "last_loaded_profile_name", profile_names[0]
+                )
+
+            profile = conn.execute(
+                "select cast(data as blob) from profiles where name = ?",
+                (self._profile_name,),
+            ).fetchone()
         finally:
             conn.close()
 
-        profiles_dict = {name: pickle.loads(data) for name, data in profiles}
-
-        if self._profile_name is None:
-            self._profile_name = self._meta.get(
-                "last_loaded_profile_name", profiles[0][0]
-            )
+        if profile is None:
+            console.print(f"Profile does not exist: {self._profile_name}")
+            raise Abort()
 
         self._collection_db_path = str(
             base_path / self._profile_name / "collection.anki2"
         )
-        self._profile = profiles_dict[self._profile_name]
+        self._profile = pickle.loads(profile[0])
 
     def _init_load_collection(self) -> None:
         """Load the Anki collection"""
-        # pylint: disable=import-outside-toplevel
-        from anki.collection import Collection
-        from anki.errors import DBError
-
-        # Save CWD (because Anki changes it)
-        save_cwd = os.getcwd()
-
-        try:
-            self.col = Collection(self._collection_db_path)
-        except AssertionError as error:
-            console.print("Path to database is not valid!")
-            console.print(f"path = {self._collection_db_path}")
-            raise Abort() from error
-        except DBError as error:
-            console.print("Database is NA/locked!")
-            raise Abort() from error
-
-        # Restore CWD (because Anki changes it)
-        os.chdir(save_cwd)
+        # Restore CWD afterwards, also on errors (because Anki changes it)
+        with cd(os.getcwd()):
+            try:
+                self.col = Collection(self._collection_db_path)
+            except AssertionError as error:
+                console.print("Path to database is not valid!")
+                console.print(f"path = {self._collection_db_path}")
+                raise Abort() from error
+            except DBError as error:
+                console.print("Database is NA/locked!")
+                raise Abort() from error
 
     @staticmethod
     def _init_load_config() -> None:
         """Load custom configuration"""
-        # pylint: disable=import-outside-toplevel
-        from anki import latex
-
         # Update LaTeX commands
         # * Idea based on Anki addon #1546037973 ("Edit LaTeX build process")
         if "pngCommands" in cfg:
@@ -158,9 +173,6 @@ class Anki:
 
     def sync(self) -> None:
         """Sync collection to AnkiWeb"""
-        # pylint: disable=import-outside-toplevel
-        from anki.sync import SyncAuth
-
         if self._profile is None:
             return
 
@@ -195,87 +207,140 @@ class Anki:
             progress.update(t1, total=1, completed=1, description="[green]done!")
 
             # Perform media sync
-            with cd(self.col.media.dir()):
-                status_str = ""
-                self.col.sync_media(auth)
-                try:
-                    while True:
-                        time.sleep(0.01)
-                        status = self.col.media_sync_status()
-                        if p := status.progress:
-                            status_str = f"{p.added}, {p.removed}, {p.checked}".lower()
-                            progress.update(t2, description=f"[blue]({status_str})")
-                        if not status.active:
-                            break
-
-                except Exception as error:
-                    if "sync cancelled" in str(error):
-                        progress.update(
-                            t2,
-                            total=1,
-                            completed=1,
-                            description="[yellow]cancelled!",
-                        )
-                        return
-                    raise Abort() from error
-
-                progress.update(
-                    t2,
-                    total=1,
-                    completed=1,
-                    description=f"[blue]({status_str}) [green]done!",
-                )
+            status_str = ""
+            self.col.sync_media(auth)
+            try:
+                while True:
+                    time.sleep(0.01)
+                    status = self.col.media_sync_status()
+                    if p := status.progress:
+                        status_str = f"{p.added}, {p.removed}, {p.checked}".lower()
+                        progress.update(t2, description=f"[blue]({status_str})")
+                    if not status.active:
+                        break
+
+            except Exception as error:
+                if "sync cancelled" in str(error):
+                    progress.update(
+                        t2,
+                        total=1,
+                        completed=1,
+                        description="[yellow]cancelled!",
+                    )
+                    return
+                raise Abort() from error
+
+            progress.update(
+                t2,
+                total=1,
+                completed=1,
+                description=f"[blue]({status_str}) [green]done!",
+            )
 
     def check_media(self) -> None:
         """Check media (will rebuild missing LaTeX files)"""
-        # pylint: disable=import-outside-toplevel
-        from anki.notes import NoteId
-
-        with cd(self.col.media.dir()):
-            with Progress(
-                TextColumn("{task.description}"),
-                SpinnerColumn(spinner_name="point", finished_text=""),
-                console=console,
-            ) as progress:
-                t1 = progress.add_task("Checking media DB [green]… ", total=None)
-                output = self.col.media.check()
-                progress.update(
-                    t1,
-                    total=1,
-                    completed=1,
-                    description="Checking media DB [green]… done!",
-                )
+        media_dir = Path(self.col.media.dir())
 
-            if len(output.missing) + len(output.unused) == 0:
-                console.print("[white]No unused or missing files found.")
-                return
+        with Progress(
+            TextColumn("{task.description}"),
+            SpinnerColumn(spinner_name="point", finished_text=""),
+            console=console,
+        ) as progress:
+            t1 = progress.add_task("Checking media DB [green]… ", total=None)
+            output = self.col.media.check()
+            progress.update(
+                t1,
+                total=1,
+                completed=1,
+                description="Checking media DB [green]… done!",
+            )
+
+        if len(output.missing) + len(output.unused) == 0:
+            console.print("[white]No unused or missing files found.")
+            return
 
-            for file in output.missing:
-                console.print(f"[red]Missing: {file}")
+        for file in output.missing:
+            console.print(f"[red]Missing: {file}")
 
-            if len(output.missing) > 0 and console.confirm("Render missing LaTeX?"):
-                out = self.col.media.render_all_latex()
-                if out is not None:
-                    nid = NoteId(out[0])
-                    console.print(f"[red]Error processing note: {nid}")
+        if len(output.missing) > 0 and console.confirm("Render missing LaTeX?"):
+            out = self.col.media.render_all_latex()
+            if out is not None:
+                nid = NoteId(out[0])
+                console.print(f"[red]Error processing note: {nid}")
 
-                    if console.confirm("Review note?"):
-                        note = Note(self, self.col.get_note(nid))
-                        note.review()
+                if console.confirm("Review note?"):
+                    note = Note(self, self.col.get_note(nid))
+                    note.review()
 
-            for file in output.unused:
-                console.print(f"[red]Unused: {file}")
+        for file in output.unused:
+            console.print(f"[red]Unused: {file}")
 
-            if len(output.unused) > 0 and console.confirm("Delete unused media?"):
-                for file in output.unused:
-                    if os.path.isfile(file):
-                        os.remove(file)
+        if len(output.unused) > 0 and console.confirm("Delete unused media?"):
+
+            def remove_file(file: str) -> None:
+                path = media_dir / file
+                if path.is_file():
+                    path.unlink()
+
+            # Removing many files one by one is slow on network or other slow
+            # storage, so we remove them concurrently
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                list(executor.map(remove_file, output.unused))
 
     def find_notes(self, query: str) -> Generator[Note, None, None]:
         """Find notes in Collection and return Note objects"""
-        return (
-            Note(self, self.col.get_note(i)) for i in set(self.col.find_notes(query))
-        )
+        note_ids = self.col.find_notes(query)
+        return self._get_notes(note_ids)
+
+    def _find_note_ids(self, query: str | Sequence[NoteId]) -> Sequence[NoteId]:
+        """Find note ids that match query, unless it is already a list of note ids"""
+        if isinstance(query, str):
+            return self.col.find_notes(query)
+
+        return query
+
+    def get_note(self, note_id: NoteId) -> Optional[Note]:
+        """Get Note object for a note id (None if the note does not exist)"""
+        try:
+            return Note(self, self.col.get_note(note_id))
+        except NotFoundError:
+            return None
+
+    def _get_notes(
+        self, note_ids: Sequence[NoteId], chunk_size: int = 500
+    ) -> Generator[Note, None, None]:
+        """Get Note objects for the given note ids"""
+        for i in range(0, len(note_ids), chunk_size):
+            chunk = note_ids[i : i + chunk_size]
+
+            # Get the suspended state for the whole chunk with a single query
+            # instead of loading the cards of every note separately
+            suspended = set(
+                self.col.db.list(
+                    "select distinct nid from cards where queue = -1 and nid in "
+                    + ids2str(chunk)
+                )
+            )
+
+            for note_id in chunk:
+                yield Note(self, self.col.get_note(note_id), note_id in suspended)
+
+    def _get_first_card_ids(
+        self, note_ids: Sequence[NoteId], chunk_size: int = 500
+    ) -> Generator[CardId, None, None]:
+        """Get the id of the first card of each note"""
+        for i in range(0, len(note_ids), chunk_size):
+            chunk = note_ids[i : i + chunk_size]
+
+            first_card_ids: dict[int, int] = {}
+            for note_id, card_id in self.col.db.all(
+                f"select nid, id from cards where nid in {ids2str(chunk)} order by ord"
+            ):
+                first_card_ids.setdefault(note_id, card_id)
+
+            for note_id in chunk:
+                if note_id in first_card_ids:
+                    yield CardId(first_card_ids[note_id])
 
     def delete_notes(self, ids: NoteId | list[NoteId]) -> None:
         """Delete notes by note ids"""
@@ -287,9 +352,6 @@ class Anki:
 
     def get_model(self, model_name: str) -> Optional[NotetypeDict]:
         """Get model from model name"""
-        # pylint: disable=import-outside-toplevel
-        from anki.models import NotetypeId
-
         model_id = self.model_name_to_id.get(model_name)
         if not isinstance(model_id, int):
             return None
@@ -298,8 +360,14 @@ class Anki:
 
     def set_model(self, model_name: str) -> NotetypeDict:
         """Set current model based on model name"""
+        # Avoid the backend lookup when the model is set repeatedly, e.g. when
+        # adding many notes of the same model
+        if (current := self._current_model) and current["name"] == model_name:
+            return current
+
         current = self.col.models.current(for_deck=False)
         if current["name"] == model_name:
+            self._current_model = current
             return current
 
         model = self.get_model(model_name)
@@ -308,8 +376,19 @@ class Anki:
             raise Abort()
 
         self.col.models.set_current(model)
+        self._current_model = model
         return model
 
+    def get_model_field_names(self, model: NotetypeDict) -> tuple[str, ...]:
+        """Get the field names of a model"""
+        model_id = model["id"]
+        field_names = self._model_field_names.get(model_id)
+        if field_names is None:
+            field_names = tuple(field["name"] for field in model["flds"])
+            self._model_field_names[model_id] = field_names
+
+        return field_names
+
     def rename_model(self, old_model_name: str, new_model_name: str) -> None:
         """Rename a model"""
         model = self.get_model(old_model_name)
@@ -322,8 +401,11 @@ class Anki:
         model["name"] = new_model_name
 
         # Update local storage
-        self.model_name_to_id = {m["name"]: m["id"] for m in self.col.models.all()}
-        self.model_names = list(self.model_name_to_id.keys())
+        self.model_name_to_id[new_model_name] = self.model_name_to_id.pop(
+            old_model_name
+        )
+        self._model_field_names.pop(model["id"], None)
+        self._current_model = None
 
         # Save changes
         self.col.models.update_dict(model)
@@ -335,26 +417,40 @@ class Anki:
         table.add_column("tag", style="cyan")
         table.add_column("notes", style="magenta", justify="right")
 
-        if sort_by_count:
-            sorter = lambda x: x[1]
-        else:
-            sorter = lambda x: x[0]
+        sorter = itemgetter(1) if sort_by_count else itemgetter(0)
 
-        tags = [(t, len(self.col.find_notes(f"tag:{t}"))) for t in self.col.tags.all()]
+        # Count the notes for all tags in a single pass over the notes table instead
+        # of one search per tag. Tag searches are case insensitive and also match
+        # child tags ("tag:a" matches "a::b"), so count each parent tag as well.
+        counts: Counter[str] = Counter()
+        for note_tags in self.col.db.list("select tags from notes"):
+            matched: set[str] = set()
+            for tag in note_tags.lower().split():
+                parts = tag.split("::")
+                matched.update("::".join(parts[: i + 1]) for i in range(len(parts)))
+            counts.update(matched)
+
+        tags = [(t, counts[t.lower()]) for t in self.col.tags.all()]
         for tag, n in sorted(tags, key=sorter):
             table.add_row(tag, str(n))
 
         console.print(table)
 
-    def change_tags(self, query: str, tags: str, add: bool = True) -> None:
-        """Add/Remove tags from notes that match query"""
-        note_ids = self.col.find_notes(query)
+    def change_tags(
+        self, query: str | Sequence[NoteId], tags: str, add: bool = True
+    ) -> None:
+        """Add/Remove tags from notes that match query (or from a list of note ids)"""
+        note_ids = self._find_note_ids(query)
+        if not note_ids:
+            return
+
         if add:
-            self.col.tags.bulk_add(note_ids, tags)
+            changes = self.col.tags.bulk_add(note_ids, tags)
         else:
-            self.col.tags.bulk_remove(note_ids, tags)
+            changes = self.col.tags.bulk_remove(note_ids, tags)
 
-        self.modified = True
+        if changes.count > 0:
+            self.modified = True
 
     def edit_model_css(self, model_name: str) -> None:
         """Edit the CSS part of a given model."""
@@ -380,73 +476,107 @@ class Anki:
         if model["css"] != new_content:
             model["css"] = new_content
             self.col.models.save(model, templates=True)
+            self._model_field_names.pop(model["id"], None)
+            self._current_model = None
             self.modified = True
 
-    def list_notes(self, query: str) -> None:
-        """List notes that match a query"""
-        for note in self.find_notes(query):
-            cards.print_question(note.n.cards()[0])
+    def list_notes(self, query: str | Sequence[NoteId]) -> None:
+        """List notes that match a query (or a list of note ids)"""
+        note_ids = self._find_note_ids(query)
+
+        # Buffer the output and write it in one go instead of once per note
+        width = console.width
+        with console:
+            for card_id in self._get_first_card_ids(note_ids):
+                cards.print_question(self.col.get_card(card_id), width)
 
     def list_cards(self, query: str, opts_display: dict[str, bool]) -> None:
         """List cards that match a query"""
+        # Collect the names of the enabled display options
+        show = {key for key, value in opts_display.items() if value}
+
         width = console.width - 1
-        if opts_display.get("show_cid", False):
+        if "show_cid" in show:
             width -= 15
-        if opts_display.get("show_due", False):
+        if "show_due" in show:
             width -= 6
-        if opts_display.get("show_type", False):
+        if "show_type" in show:
             width -= 9
-        if opts_display.get("show_ease", False):
+        if "show_ease" in show:
             width -= 5
-        if opts_display.get("show_lapses", False):
+        if "show_lapses" in show:
             width -= 5
-        if opts_display.get("show_model", False):
+        if "show_model" in show:
             width -= 25
-        if opts_display.get("show_answer", False):
+        if "show_answer" in show:
             width //= 2
             width -= 1
 
         table = Table(box=None, header_style="bold white")
         table.add_column("question")
-        if opts_display.get("show_answer", False):
+        if "show_answer" in show:
             table.add_column("answer")
-        if opts_display.get("show_cid", False):
+        if "show_cid" in show:
             table.add_column("cid", min_width=13)
-        if opts_display.get("show_due", False):
+        if "show_due" in show:
             table.add_column("due", min_width=4)
-        if opts_display.get("show_type", False):
+        if "show_type" in show:
             table.add_column("type", min_width=8)
-        if opts_display.get("show_ease", False):
+        if "show_ease" in show:
             table.add_column("ease", min_width=3)
-        if opts_display.get("show_lapses", False):
+        if "show_lapses" in show:
             table.add_column("lapses", min_width=3)
-        if opts_display.get("show_model", False):
+        if "show_model" in show:
             table.add_column("model", min_width=10)
 
-        for cid in self.col.find_cards(query):
-            card = self.col.get_card(cid)
-            row: list[str | Text] = [
-                cards.card_field_to_text(card.question(), max_width=width)
-            ]
-            if opts_display.get("show_answer", False):
-                row += [cards.card_field_to_text(card.answer(), max_width=width)]
-            if opts_display.get("show_cid", False):
-                row += [str(card.id)]
-            if opts_display.get("show_due", False):
-                row += [str(card.due)]
-            if opts_display.get("show_type", False):
-                card_type = ["new", "learning", "review", "relearning"][int(card.type)]
-                row += [card_type]
-            if opts_display.get("show_ease", False):
-                row += [str(int(card.factor / 10))]
-            if opts_display.get("show_lapses", False):
-                row += [str(card.lapses)]
-            if opts_display.get("show_model", False):
-                row += [card.note_type()["name"]]
-            table.add_row(*row)
+        card_ids = self.col.find_cards(query)
+
+        # Get the model names for all cards with a single query, instead of
+        # loading the note and the model for every card
+        model_names: dict[int, str] = {}
+        if "show_model" in show:
+            model_id_to_name = {v: k for k, v in self.model_name_to_id.items()}
+            model_names = {
+                card_id: model_id_to_name.get(model_id, "")
+                for card_id, model_id in self.col.db.all(
+                    "select c.id, n.mid from cards c join notes n on c.nid = n.id "
+                    "where c.id in " + ids2str(card_ids)
+                )
+            }
+
+        for cid in card_ids:
+            table.add_row(
+                *self._get_card_row(
+                    self.col.get_card(cid), show, width, model_names.get(cid, "")
+                )
+            )
 
         console.print(table)
 
+    @staticmethod
+    def _get_card_row(
+        card: Card, show: set[str], width: int, model_name: str
+    ) -> list[str | Text]:
+        """Get the table row of a card for list_cards"""
+        row: list[str | Text] = [
+            cards.card_field_to_text(card.question(), max_width=width)
+        ]
+        if "show_answer" in show:
+            row += [cards.card_field_to_text(card.answer(), max_width=width)]
+        if "show_cid" in show:
+            row += [str(card.id)]
+        if "show_due" in show:
+            row += [str(card.due)]
+        if "show_type" in show:
+            row += [_CARD_TYPES[int(card.type)]]
+        if "show_ease" in show:
+            row += [str(int(card.factor / 10))]
+        if "show_lapses" in show:
+            row += [str(card.lapses)]
+        if "show_model" in show:
+            row += [model_name]
+        return row
+
     def add_notes_with_editor(
         self,
         tags: str = "",
@@ -479,11 +609,8 @@ class Anki:
             input_strings += ["\n# Note\n"]
 
             model = self.set_model(model_name)
-            input_strings += [
-                x
-                for y in [[f'## {field["name"]}', ""] for field in model["flds"]]
-                for x in y
-            ]
+            for field_name in self.get_model_field_names(model):
+                input_strings += [f"## {field_name}", ""]
 
             input_string = "\n".join(input_strings) + "\n"
 
@@ -514,12 +641,18 @@ class Anki:
         deck: Optional[str] = None,
     ) -> list[Note]:
         """Add new notes to collection from note list (from parsed file)"""
-        notes = []
-        for note in parsed_notes:
-            if note.deck is None:
-                note.deck = deck
-            note.tags = f"{tags} {note.tags}"
-            notes.append(note.add_to_collection(self))
+        notes: list[Note] = []
+
+        def _add_notes() -> None:
+            for note in parsed_notes:
+                if note.deck is None:
+                    note.deck = deck
+                note.tags = f"{tags} {note.tags}"
+                notes.append(note.add_to_collection(self))
+
+        # Add all notes within a single transaction. This avoids a commit for every
+        # note, and any error will roll back the notes that were already added.
+        self.col.db.transact(_add_notes)
 
         return notes
 
@@ -12,19 +12,35 @@ if TYPE_CHECKING:
     from anki.cards import Card
 
 
+# Rich styles for the card flags
+_FLAG_STYLES = {
+    1: "red",
+    2: "orange",
+    3: "green",
+    4: "blue",
+    5: "pink1",
+    6: "medium_turquoise",
+    7: "purple",
+}
+
+
 def card_field_to_text(field: str, max_width: int = 0) -> Text:
     prepared_field = prepare_field_for_cli_oneline(field)
-    if max_width > 0:
-        prepared_field = prepared_field[0:max_width]
+    if 0 < max_width < len(prepared_field):
+        prepared_field = prepared_field[:max_width]
     return Text.from_markup(prepared_field)
 
 
-def print_question(card: Card) -> None:
-    """Print the card question"""
+def print_question(card: Card, width: int = 0) -> None:
+    """Print the card question
+
+    Note: The console width is looked up if width is not given. Pass it when
+    printing many cards, since each lookup queries the terminal size.
+    """
     question = Text("Q: ")
     question.stylize("yellow", 0, 2)
     question.append_text(card_field_to_text(card.question()))
-    console.print(question.fit(console.width))
+    console.print(question.fit(width or console.width))
 
 
 def print_answer(card: Card) -> None:
@@ -53,17 +69,7 @@ def print_stats(card: Card) -> None:
 
 def get_flag(card: Card, text: str = "  ") -> str:
     """Get rich formatted flag of card"""
-    style = {
-        1: "red",
-        2: "orange",
-        3: "green",
-        4: "blue",
-        5: "pink1",
-        6: "medium_turquoise",
-        7: "purple",
-    }.get(card.flags)
-
-    if style:
+    if style := _FLAG_STYLES.get(card.flags):
         return f"[{style}]{text}[/{style}]"
 
     return ""
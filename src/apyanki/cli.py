@@ -1,19 +1,21 @@
 """A script to interact with the Anki database"""
 
+from __future__ import annotations
 import os
 from pathlib import Path
 import sys
-from typing import Any, Optional
+from typing import Any, Optional, TYPE_CHECKING
 
 import click
 
-from apyanki import __version__
-from apyanki.anki import Anki
 from apyanki.config import cfg, cfg_file
 from apyanki.console import console
-from apyanki.note import Note
 from apyanki.utilities import suppress_stdout
 
+if TYPE_CHECKING:
+    from apyanki.anki import Anki
+    from apyanki.note import Note
+
 CONTEXT_SETTINGS = {"help_option_names": ["-h", "--help"]}
 
 
@@ -46,6 +48,9 @@ def main(ctx: Any, base_path: str, profile_name: str, version: bool) -> None:
     Note: Use `apy subcmd --help` to get detailed help for a given subcommand.
     """
     if version:
+        # pylint: disable=import-outside-toplevel
+        from apyanki import __version__
+
         console.print(f"apy {__version__}")
         sys.exit()
 
@@ -92,7 +97,7 @@ def add_single(
         # Add a note to deck "MyDeck" with tags 'my-tag' and 'new-tag'
         apy add-single -t "my-tag new-tag" -d MyDeck myfront myback
     """
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         tags_preset = " ".join(cfg["presets"][preset]["tags"])
         if not tags:
             tags = tags_preset
@@ -128,7 +133,7 @@ def add(tags: str, model_name: str, deck: str) -> None:
         # Ask for the model and the deck for each new card
         apy add -m ASK -d ask
     """
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         notes = a.add_notes_with_editor(tags, model_name, deck)
         _added_notes_postprocessing(a, notes)
 
@@ -186,11 +191,23 @@ def add_from_file(file: Path, tags: str, deck: str) -> None:
         ## FieldThree
         FieldThree
     """
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         notes = a.add_notes_from_file(str(file), tags, deck)
         _added_notes_postprocessing(a, notes)
 
 
+def _open_anki() -> Anki:
+    """Open the Anki collection
+
+    Note: The anki modules are slow to import, so they are only imported by the
+    commands that need the collection.
+    """
+    # pylint: disable=import-outside-toplevel
+    from apyanki.anki import Anki
+
+    return Anki(**cfg)
+
+
 def _added_notes_postprocessing(a: Anki, notes: list[Note]) -> None:
     """Common postprocessing after 'apy add[-from-file]'."""
     n_notes = len(notes)
@@ -198,7 +215,21 @@ def _added_notes_postprocessing(a: Anki, notes: list[Note]) -> None:
         console.print("No notes added")
         return
 
-    decks = [a.col.decks.name(c.did) for n in notes for c in n.n.cards()]
+    # pylint: disable=import-outside-toplevel
+    from anki.utils import ids2str
+
+    # Get the cards and decks of all the new notes with a single query
+    card_ids: dict[int, list[int]] = {n.n.id: [] for n in notes}
+    deck_ids: dict[int, None] = {}
+    for nid, cid, did in a.col.db.all(
+        "select nid, id, did from cards where nid in "
+        + ids2str(card_ids)
+        + " order by ord"
+    ):
+        card_ids[nid].append(cid)
+        deck_ids[did] = None
+
+    decks = [a.col.decks.name(did) for did in deck_ids]
     n_decks = len(decks)
     if n_decks == 0:
         console.print("No notes added")
@@ -214,17 +245,19 @@ def _added_notes_postprocessing(a: Anki, notes: list[Note]) -> None:
     else:
         console.print(f"Added {n_notes} notes")
 
-    for note in notes:
-        cards = note.n.cards()
-        console.print(f"* nid: {note.n.id} (with {len(cards)} cards)")
-        for card in note.n.cards():
-            console.print(f"  * cid: {card.id}")
+    # Buffer the output and write it in one go instead of once per line
+    with console:
+        for note in notes:
+            note_card_ids = card_ids[note.n.id]
+            console.print(f"* nid: {note.n.id} (with {len(note_card_ids)} cards)")
+            for card_id in note_card_ids:
+                console.print(f"  * cid: {card_id}")
 
 
 @main.command("check-media")
 def check_media() -> None:
     """Check media."""
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         a.check_media()
 
 
@@ -238,71 +271,108 @@ def info() -> None:
     else:
         console.print("Config file:       Not found")
 
-    with Anki(**cfg) as a:
-        scheduler = 3 if a.col.v3_scheduler() else a.col.sched_ver()
-        console.print(f"Collection path:   {a.col.path}")
-        console.print(f"Scheduler version: {scheduler}")
-
-        if a.col.decks.count() > 1:
-            console.print("Decks:")
-            for name in sorted(a.deck_names):
-                console.print(f"  - {name}")
-
-        sum_notes = a.col.note_count()
-        sum_marked = len(a.col.find_notes("tag:marked"))
-        sum_cards = a.col.card_count()
-        sum_due = len(a.col.find_cards("is:due"))
-        sum_new = len(a.col.find_cards("is:new"))
-        sum_flagged = len(a.col.find_cards("-flag:0"))
-        sum_susp = len(a.col.find_cards("is:suspended"))
-
-        console.print(
-            "\n"
-            f"{'Model':24s} "
-            f"{'notes':>7s} "
-            f"{'marked':>7s} "
-            f"{'cards':>7s} "
-            f"{'due':>7s} "
-            f"{'new':>7s} "
-            f"{'flagged':>7s}"
-            f"{'susp.':>7s} "
-        )
-        console.rule()
-        models = sorted(a.model_names)
-        for m in models:
-            nnotes = len(set(a.col.find_notes(f'"note:{m}"')))
-            if nnotes == 0:
-                continue
-            nmarked = len(a.col.find_notes(f'"note:{m}" tag:marked'))
-            ncards = len(a.col.find_cards(f'"note:{m}"'))
-            ndue = len(a.col.find_cards(f'"note:{m}" is:due'))
-            nnew = len(a.col.find_cards(f'"note:{m}" is:new'))
-            nflagged = len(a.col.find_cards(f'"note:{m}" -flag:0'))
-            nsusp = len(a.col.find_cards(f'"note:{m}" is:suspended'))
-
-            name = m[:24]
+    with _open_anki() as a:
+        # Buffer the console output and write it in one go
+        with console:
+            scheduler = 3 if a.col.v3_scheduler() else a.col.sched_ver()
+            console.print(f"Collection path:   {a.col.path}")
+            console.print(f"Scheduler version: {scheduler}")
+
+            if a.col.decks.count() > 1:
+                console.print("Decks:")
+                for name in sorted(a.deck_names):
+                    console.print(f"  - {name}")
+
             console.print(
-                f"{name:24s} "
-                f"{nnotes:7d} "
-                f"{nmarked:7d} "
-                f"{ncards:7d} "
-                f"{ndue:7d} "
-                f"{nnew:7d} "
-                f"{nflagged:7d}"
-                f"{nsusp:7d} "
+                "\n"
+                f"{'Model':24s} "
+                f"{'notes':>7s} "
+                f"{'marked':>7s} "
+                f"{'cards':>7s} "
+                f"{'due':>7s} "
+                f"{'new':>7s} "
+                f"{'flagged':>7s}"
+                f"{'susp.':>7s} "
             )
-        console.rule()
-        console.print(
-            f"{'Sum':24s} "
-            f"{sum_notes:7d} "
-            f"{sum_marked:7d} "
-            f"{sum_cards:7d} "
-            f"{sum_due:7d} "
-            f"{sum_new:7d} "
-            f"{sum_flagged:7d}"
-            f"{sum_susp:7d} "
+            console.rule()
+
+            rows, sums = _count_per_model(a)
+            for name, counts in rows:
+                console.print(_format_info_row(name[:24], counts))
+            console.rule()
+            console.print(_format_info_row("Sum", sums))
+            console.rule()
+
+
+def _count_per_model(
+    a: Anki,
+) -> tuple[list[tuple[str, tuple[int, ...]]], tuple[int, ...]]:
+    """Count notes and cards per model for 'apy info'
+
+    Returns the counts for each model with notes, sorted by model name, and the
+    sums of the counts. The counts are the number of notes, marked notes, cards,
+    due cards, new cards, flagged cards and suspended cards.
+    """
+    # pylint: disable=import-outside-toplevel
+    from anki.utils import ids2str
+
+    # Count everything per model with a few grouped queries instead of separate
+    # searches for every model. The results of the is:due and tag:marked
+    # searches are counted per model.
+    marked = dict(
+        a.col.db.all(
+            "select mid, count() from notes "
+            f"where id in {ids2str(a.col.find_notes('tag:marked'))} group by mid"
+        )
+    )
+    due = dict(
+        a.col.db.all(
+            "select n.mid, count() from cards c join notes n on c.nid = n.id "
+            f"where c.id in {ids2str(a.col.find_cards('is:due'))} group by n.mid"
+        )
+    )
+    counts = {
+        mid: (
+            nnotes,
+            marked.get(mid, 0),
+            ncards,
+            due.get(mid, 0),
+            nnew,
+            nflagged,
+            nsusp,
+        )
+        for mid, nnotes, ncards, nnew, nflagged, nsusp in a.col.db.all(
+            "select n.mid, count(distinct n.id), count(), sum(c.type = 0), "
+            "sum(c.flags & 7 != 0), sum(c.queue = -1) "
+            "from cards c join notes n on c.nid = n.id group by n.mid"
         )
-        console.rule()
+    }
+
+    rows: list[tuple[str, tuple[int, ...]]] = [
+        (name, counts[mid])
+        for name in sorted(a.model_names)
+        if (mid := a.model_name_to_id[name]) in counts
+    ]
+
+    # The sums are computed from the per model counts
+    sums = tuple(sum(column) for column in zip(*(row for _, row in rows)))
+
+    return rows, sums or (0,) * 7
+
+
+def _format_info_row(name: str, counts: tuple[int, ...]) -> str:
+    """Format a row of counts in the model table of 'apy info'"""
+    nnotes, nmarked, ncards, ndue, nnew, nflagged, nsusp = counts
+    return (
+        f"{name:24s} "
+        f"{nnotes:7d} "
+        f"{nmarked:7d} "
+        f"{ncards:7d} "
+        f"{ndue:7d} "
+        f"{nnew:7d} "
+        f"{nflagged:7d}"
+        f"{nsusp:7d} "
+    )
 
 
 @main.group(context_settings=CONTEXT_SETTINGS, invoke_without_command=True)
@@ -320,7 +390,7 @@ def model() -> None:
 @click.option("-s", "--sync-after", is_flag=True, help="Perform sync after any change.")
 def edit_css(model_name: str, sync_after: bool) -> None:
     """Edit the CSS template for the specified model."""
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         a.edit_model_css(model_name)
 
         if a.modified and sync_after:
@@ -333,7 +403,7 @@ def edit_css(model_name: str, sync_after: bool) -> None:
 @click.argument("new-name")
 def rename(old_name: str, new_name: str) -> None:
     """Rename model from old_name to new_name."""
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         a.rename_model(old_name, new_name)
 
 
@@ -371,7 +441,7 @@ def list_cards(
     else:
         query = cfg["query"]
 
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         a.list_cards(
             query,
             {
@@ -417,21 +487,29 @@ def review(query: str, check_markdown_consistency: bool, cmc_range: int) -> None
     else:
         query = cfg["query"]
 
-    with Anki(**cfg) as a:
-        notes = list(a.find_notes(query))
+    with _open_anki() as a:
+        # Only keep the note ids, so that each note is loaded when it is reviewed
+        note_ids = list(a.col.find_notes(query))
 
         # Add inconsistent notes
         if check_markdown_consistency:
-            notes += [
-                n
+            found = set(note_ids)
+            note_ids += [
+                n.n.id
                 for n in a.find_notes(f"rated:{cmc_range}")
-                if not n.has_consistent_markdown()
+                if n.n.id not in found and not n.has_consistent_markdown()
             ]
 
         i = 0
-        number_of_notes = len(notes)
+        number_of_notes = len(note_ids)
         while i < number_of_notes:
-            note = notes[i]
+            note = a.get_note(note_ids[i])
+            if note is None:
+                # The note was deleted, e.g. before rewinding to it
+                del note_ids[i]
+                number_of_notes -= 1
+                continue
+
             status = note.review(i, number_of_notes)
 
             if status == "stop":
@@ -446,7 +524,7 @@ def review(query: str, check_markdown_consistency: bool, cmc_range: int) -> None
 @main.command()
 def sync() -> None:
     """Synchronize collection with AnkiWeb."""
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         a.sync()
 
 
@@ -492,20 +570,22 @@ def tag(
     else:
         query = cfg["query"]
 
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         if (add_tags is None or add_tags == "") and (
             remove_tags is None or remove_tags == ""
         ):
             a.list_tags(sort_by_count)
             return
 
-        n_notes = len(list(a.find_notes(query)))
+        # Search once and apply everything below to the found notes
+        note_ids = a.col.find_notes(query)
+        n_notes = len(note_ids)
         if n_notes == 0:
             console.print("No matching notes!")
             raise click.Abort()
 
         console.print(f"The operation will be applied to {n_notes} matched notes:")
-        a.list_notes(query)
+        a.list_notes(note_ids)
         console.print("")
 
         if add_tags is not None:
@@ -516,11 +596,15 @@ def tag(
         if not console.confirm("Continue?"):
             raise click.Abort()
 
-        if add_tags is not None:
-            a.change_tags(query, add_tags)
+        def _change_tags() -> None:
+            if add_tags is not None:
+                a.change_tags(note_ids, add_tags)
 
-        if remove_tags is not None:
-            a.change_tags(query, remove_tags, add=False)
+            if remove_tags is not None:
+                a.change_tags(note_ids, remove_tags, add=False)
+
+        # Apply both changes within a single transaction
+        a.col.db.transact(_change_tags)
 
 
 @main.command()
@@ -535,7 +619,7 @@ def reposition(position: int, query: str) -> None:
     """
     query = " ".join(query)
 
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         cids = list(a.col.find_cards(query))
         if not cids:
             console.print(f"No matching cards for query: {query}!")
@@ -566,7 +650,7 @@ def reposition(position: int, query: str) -> None:
 )
 def backup(target_file: Path, include_media: bool, legacy: bool) -> None:
     """Backup Anki database to specified target file."""
-    with Anki(**cfg) as a:
+    with _open_anki() as a:
         target_filename = str(target_file)
 
         if not target_filename.endswith(".colpkg"):
@@ -3,7 +3,6 @@
 from typing import Any, Optional
 
 import click
-import readchar
 from rich.console import Console
 from rich.prompt import Confirm, IntPrompt, Prompt
 
@@ -13,6 +12,9 @@ class ApyConsole(Console):
 
     def wait_for_keypress(self) -> None:
         """Wait for keypress to continue."""
+        # pylint: disable=import-outside-toplevel
+        import readchar
+
         console.print(
             "[white]Press [italic]any key[/italic] to continue ... [/white]", end=""
         )
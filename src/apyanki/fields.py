@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 import base64
+from functools import cache, lru_cache
 from pathlib import Path
 import re
-from typing import Optional, TYPE_CHECKING
+import string
+from typing import Iterable, Optional, TYPE_CHECKING
 import warnings
 
+from anki import latex
 from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning, Tag
 import markdown
 from markdown.extensions.abbr import AbbrExtension
@@ -26,24 +29,60 @@ if TYPE_CHECKING:
 warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
 
 
+# Precompiled patterns for functions that are called for every listed card/note
+_STYLE_BLOCK_RE = re.compile(r"\<style\>.*\<\/style\>", flags=re.S)
+_ONELINE_WHITESPACE_RE = re.compile(r"\s\s+|\n")
+_CLI_REGEX_REPLACES = [
+    (re.compile(r"\[latex\]\s*(.*?)\[/latex\]", flags=re.S), r"```tex\n\1\n```"),
+    (re.compile(r"\<div\>\s*(.*?)\s*\</div\>", flags=re.S), r"\n\1"),
+]
+_CLI_REGEX_REPLACES_MARKUP = _CLI_REGEX_REPLACES + [
+    (re.compile(r"<b>(.*?)</b>", flags=re.S), r"[bold]\1[/bold]"),
+    (re.compile(r"<i>(.*?)</i>", flags=re.S), r"[italic]\1[/italic]"),
+    (re.compile(r"\*\*(.*?)\*\*", flags=re.S), r"[bold]\1[/bold]"),
+    (re.compile(r"_(.*?)_", flags=re.S), r"[italic]\1[/italic]"),
+    (re.compile(r"`(.*?)`", flags=re.S), r"[magenta]\1[/magenta]"),
+]
+
+# Precompiled patterns for converting between text and field HTML
+_PLAIN_TEXT_DELETE = str.maketrans(
+    "", "", string.ascii_letters + string.digits + "æøåÆØÅ ,.?+-"
+)
+_MARKDOWN_ATTRIBUTE_RE = re.compile(r' data-original-markdown="[^"]*"')
+_GENERATED_FROM_MARKDOWN_RE = re.compile(
+    r"[^<]*<[a-zA-Z][^>]*\sdata-original-markdown[\s=/>]"
+)
+_ORIGINAL_MARKDOWN_RE = re.compile(
+    r'[^<]*<[a-zA-Z][^>]*\sdata-original-markdown="([^"]*)"'
+)
+_HTML_ENTITIES_RE = re.compile(r"&lt;|&gt;|&amp;(?:nbsp;)?|&nbsp;")
+_HTML_ENTITIES = {
+    "&lt;": "<",
+    "&gt;": ">",
+    "&amp;": "&",
+    "&amp;nbsp;": " ",
+    "&nbsp;": " ",
+}
+_EMPTY_BOLD_RE = re.compile(r"\<b\>\s*\<\/b\>")
+_EMPTY_ITALIC_RE = re.compile(r"\<i\>\s*\<\/i\>")
+_EMPTY_DIV_RE = re.compile(r"\<div\>\s*\<\/div\>")
+
+
+@lru_cache(maxsize=1024)
 def prepare_field_for_cli(
     field: str, use_markdown: bool = False, check_consistency: bool = True
 ) -> str:
-    """Prepare field html for printing to screen"""
+    """Prepare field html for printing to screen
+
+    Note: The results are cached, since the same fields are printed again and
+    again, e.g. when the note is redrawn during review.
+    """
     text = convert_field_to_text(field, check_consistency)
 
-    regex_replaces = [
-        [r"\[latex\]\s*(.*?)\[/latex\]", r"```tex\n\1\n```"],
-        [r"\<div\>\s*(.*?)\s*\</div\>", r"\n\1"],
-    ]
-    if not use_markdown:
-        regex_replaces += [
-            [r"<b>(.*?)</b>", r"[bold]\1[/bold]"],
-            [r"<i>(.*?)</i>", r"[italic]\1[/italic]"],
-            [r"\*\*(.*?)\*\*", r"[bold]\1[/bold]"],
-            [r"_(.*?)_", r"[italic]\1[/italic]"],
-            [r"`(.*?)`", r"[magenta]\1[/magenta]"],
-        ]
+    if use_markdown:
+        regex_replaces = _CLI_REGEX_REPLACES
+    else:
+        regex_replaces = _CLI_REGEX_REPLACES_MARKUP
 
     literal_replaces: list[list[str]]
     if use_markdown:
@@ -58,7 +97,7 @@ def prepare_field_for_cli(
         ]
 
     for pattern, repl in regex_replaces:
-        text = re.sub(pattern, repl, text, flags=re.S)
+        text = pattern.sub(repl, text)
 
     for source, target in literal_replaces:
         text = text.replace(source, target)
@@ -84,26 +123,29 @@ def prepare_field_for_cli_raw(field: str) -> str:
     return f"Could not parse!\n{field}"
 
 
+@lru_cache(maxsize=4096)
 def prepare_field_for_cli_oneline(field: str) -> str:
-    """Prepare field html for printing to screen on one line"""
+    """Prepare field html for printing to screen on one line
+
+    Note: This is used for every row when listing cards, and card answers often
+    repeat the question, so the results are cached.
+    """
     text = prepare_field_for_cli(field, check_consistency=False)
 
-    text = text.replace("\n", " ")
-    text = re.sub(r"\s\s+", " ", text)
-    return text
+    # Replace newlines and collapse repeated whitespace in a single pass
+    return _ONELINE_WHITESPACE_RE.sub(" ", text)
 
 
 def convert_field_to_text(field: str, check_consistency: bool = True) -> str:
     """Extract text from field HTML"""
     # Remove the style block, which can be present if field is taken directly from
     # a note card via card.question() or card.answer().
-    field = re.sub(r"\<style\>.*\<\/style\>", "", field, flags=re.S)
+    field = _STYLE_BLOCK_RE.sub("", field)
 
     if check_if_generated_from_markdown(field):
         return _convert_field_to_markdown(field, check_consistency)
 
-    text = _clean_html(field)
-    text = re.sub(r"\<style\>.*\<\/style\>", "", field, flags=re.S)
+    text = field
     for source, target in [
         ["<br>", "\n"],
         ["<br/>", "\n"],
@@ -119,9 +161,15 @@ def convert_text_to_field(text: str, use_markdown: bool) -> str:
     if use_markdown:
         return _convert_markdown_to_field(text)
 
-    # Convert newlines to <br> tags
-    text = text.replace("\n", "<br />")
-    return _clean_html(text)
+    return _convert_plain_text_to_field(text)
+
+
+def convert_texts_to_fields(texts: Iterable[str], use_markdown: bool) -> list[str]:
+    """Convert texts to Anki field html (e.g. all the fields of a note)."""
+    convert = (
+        _convert_markdown_to_field if use_markdown else _convert_plain_text_to_field
+    )
+    return [convert(text) for text in texts]
 
 
 def toggle_field_to_markdown(field_or_text: str) -> str:
@@ -132,8 +180,22 @@ def toggle_field_to_markdown(field_or_text: str) -> str:
     return _convert_markdown_to_field(field_or_text)
 
 
+@lru_cache(maxsize=4096)
 def check_if_generated_from_markdown(field: str) -> bool:
-    """Check if text is a generated HTML"""
+    """Check if text is a generated HTML
+
+    Note: The results are cached, since this is often checked several times
+    for the same field, e.g. both for the note and for each of its fields.
+    """
+    # Skip the regex if the attribute is not present at all
+    if "data-original-markdown" not in field:
+        return False
+
+    if _GENERATED_FROM_MARKDOWN_RE.match(field):
+        return True
+
+    # The regex only handles plain text before the first tag, so parse the HTML
+    # if there is something else, e.g. a comment or a literal "<"
     tag = _get_first_tag(BeautifulSoup(field, "html.parser"))
 
     return (
@@ -157,6 +219,10 @@ def img_paths_from_field(field_html: str) -> list[Path]:
 
     Note: The returned paths are relative to the Anki media directory.
     """
+    # Most fields have no images, so avoid parsing the HTML when possible
+    if "<img" not in field_html.lower():
+        return []
+
     soup = BeautifulSoup(field_html, "html.parser")
     return [Path(x["src"]) for x in soup.find_all("img")]
 
@@ -166,9 +232,6 @@ def img_paths_from_field_latex(html: str, ntd: NotetypeDict, anki: Anki) -> list
 
     Note: The returned paths are relative to the Anki media directory.
     """
-    # pylint: disable=import-outside-toplevel
-    from anki import latex
-
     # pylint: disable=protected-access
     proto = anki.col._backend.extract_latex(
         text=html, svg=ntd.get("latexsvg", False), expand_clozes=False
@@ -184,13 +247,18 @@ def img_paths_from_field_latex(html: str, ntd: NotetypeDict, anki: Anki) -> list
 
 def _convert_field_to_markdown(field: str, check_consistency: bool = False) -> str:
     """Extract generated markdown text from field HTML"""
-    tag = _get_first_tag(BeautifulSoup(field, "html.parser"))
-    if not tag:
-        return field
+    # Fields generated by apy store the attribute with double quotes on the
+    # first tag, so the HTML only needs to be parsed for other fields
+    if match := _ORIGINAL_MARKDOWN_RE.match(field):
+        original_markdown = match[1]
+    else:
+        tag = _get_first_tag(BeautifulSoup(field, "html.parser"))
+        if not tag:
+            return field
 
-    original_markdown = tag["data-original-markdown"]
-    if isinstance(original_markdown, list):
-        original_markdown = "\n".join(original_markdown)
+        original_markdown = tag["data-original-markdown"]
+        if isinstance(original_markdown, list):
+            original_markdown = "\n".join(original_markdown)
 
     text = (
         base64.b64decode(original_markdown.encode())
@@ -199,7 +267,7 @@ def _convert_field_to_markdown(field: str, check_consistency: bool = False) -> s
     )
 
     if check_consistency and field != _convert_markdown_to_field(text):
-        html_clean = re.sub(r' data-original-markdown="[^"]*"', "", field)
+        html_clean = _MARKDOWN_ATTRIBUTE_RE.sub("", field)
         text += f"\n\n### Current HTML → Markdown\n{to_md(html_clean)}"
         text += f"\n### Current HTML\n```html\n{html_clean}\n```"
 
@@ -212,10 +280,16 @@ def _convert_field_to_markdown(field: str, check_consistency: bool = False) -> s
     return text
 
 
+@lru_cache(maxsize=512)
 def _convert_markdown_to_field(text: str) -> str:
-    """Convert Markdown to field HTML"""
-    # Don't convert if md text is really plain
-    if re.match(r"[a-zA-Z0-9æøåÆØÅ ,.?+-]*$", text):
+    """Convert Markdown to field HTML
+
+    Note: The results are cached, since the same text is converted several
+    times, e.g. when checking markdown consistency during review.
+    """
+    # Don't convert if md text is really plain, i.e. if nothing remains after
+    # deleting the plain characters (a single trailing newline is allowed)
+    if not text.removesuffix("\n").translate(_PLAIN_TEXT_DELETE):
         return text
 
     # Prepare original markdown for restoring
@@ -239,23 +313,7 @@ def _convert_markdown_to_field(text: str) -> str:
     text = text.replace(r"\(", r"\\(")
     text = text.replace(r"\)", r"\\)")
 
-    html = markdown.markdown(
-        text,
-        extensions=[
-            "tables",
-            AbbrExtension(),
-            CodeHiliteExtension(
-                noclasses=True,
-                linenums=False,
-                pygments_style=cfg["markdown_pygments_style"],
-                guess_lang=False,
-            ),
-            DefListExtension(),
-            FencedCodeExtension(),
-            FootnoteExtension(),
-        ],
-        output_format="html",
-    )
+    html = _get_markdown_converter().convert(text)
 
     html_tree = BeautifulSoup(html, "html.parser")
 
@@ -275,15 +333,57 @@ def _convert_markdown_to_field(text: str) -> str:
     return str(html_tree)
 
 
+def _convert_plain_text_to_field(text: str) -> str:
+    """Convert plain text to field HTML"""
+    # Convert newlines to <br> tags
+    text = text.replace("\n", "<br />")
+    return _clean_html(text)
+
+
+def _get_markdown_converter() -> markdown.Markdown:
+    """Get a Markdown converter that is ready for a new conversion"""
+    # Before version 3.7 the abbr extension kept abbreviations from earlier
+    # conversions, so only reuse the converter with newer versions
+    if markdown.__version_info__ < (3, 7):
+        return _create_markdown_converter()
+
+    return _get_shared_markdown_converter().reset()
+
+
+@cache
+def _get_shared_markdown_converter() -> markdown.Markdown:
+    """Get the Markdown converter that is shared between conversions"""
+    return _create_markdown_converter()
+
+
+def _create_markdown_converter() -> markdown.Markdown:
+    """Create a Markdown converter with the extensions used by apy"""
+    return markdown.Markdown(
+        extensions=[
+            "tables",
+            AbbrExtension(),
+            CodeHiliteExtension(
+                noclasses=True,
+                linenums=False,
+                pygments_style=cfg["markdown_pygments_style"],
+                guess_lang=False,
+            ),
+            DefListExtension(),
+            FencedCodeExtension(),
+            FootnoteExtension(),
+        ],
+        output_format="html",
+    )
+
+
 def _clean_html(text: str) -> str:
     """Clean up html text"""
-    text = text.replace(r"&lt;", "<")
-    text = text.replace(r"&gt;", ">")
-    text = text.replace(r"&amp;", "&")
-    text = text.replace(r"&nbsp;", " ")
-    text = re.sub(r"\<b\>\s*\<\/b\>", "", text)
-    text = re.sub(r"\<i\>\s*\<\/i\>", "", text)
-    text = re.sub(r"\<div\>\s*\<\/div\>", "", text)
+    # Unescape the entities in a single pass. Note: "&amp;nbsp;" becomes a
+    # space, as it did when the entities were replaced one after the other.
+    text = _HTML_ENTITIES_RE.sub(lambda m: _HTML_ENTITIES[m[0]], text)
+    text = _EMPTY_BOLD_RE.sub("", text)
+    text = _EMPTY_ITALIC_RE.sub("", text)
+    text = _EMPTY_DIV_RE.sub("", text)
     return text.strip()
 
 
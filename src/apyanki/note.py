@@ -8,12 +8,11 @@ import re
 from subprocess import DEVNULL, Popen
 import tempfile
 from time import localtime, strftime
-from typing import Any, Literal, Optional, TYPE_CHECKING
+from typing import Any, Callable, Literal, Optional, TYPE_CHECKING
 
+from anki import latex
 from click import Abort
-import readchar
 from rich.columns import Columns
-from rich.markdown import Markdown
 from rich.table import Table
 from rich.text import Text
 
@@ -25,6 +24,7 @@ from apyanki.fields import (
     check_if_inconsistent_markdown,
     convert_field_to_text,
     convert_text_to_field,
+    convert_texts_to_fields,
     img_paths_from_field,
     img_paths_from_field_latex,
     prepare_field_for_cli,
@@ -35,13 +35,46 @@ from apyanki.utilities import cd, choose, edit_file
 
 if TYPE_CHECKING:
     from apyanki.anki import Anki
+    from anki.cards import Card
+    from anki.models import NotetypeDict
     from anki.notes import Note as ANote
 
 
+# Key bindings for the actions in the review menu (see Note.review)
+_REVIEW_ACTIONS = {
+    "c": "Continue",
+    "p": "Go back",
+    "e": "Edit",
+    "a": "Add new",
+    "d": "Delete",
+    "m": "Toggle markdown",
+    "*": "Toggle marked",
+    "z": "Toggle suspend",
+    "P": "Toggle pprint",
+    "F": "Clear flags",
+    "R": "Reset progress",
+    "f": "Show images",
+    "E": "Edit CSS",
+    "D": "Change deck",
+    "N": "Change model",
+    "s": "Save and stop",
+    "v": "Show cards",
+    "x": "Save and stop",
+}
+
+# Precompiled patterns for parsing Markdown files with notes
+_KEY_VALUE_RE = re.compile(r"(\w+): (.*)")
+_HEADER_RE = re.compile(r"(#+)\s*(.*)")
+_CODEBLOCK_START_RE = re.compile(r"```\w*\s*$")
+_CODEBLOCK_END_RE = re.compile(r"```\s*$")
+
+
 class Note:
     """A Note wrapper class"""
 
-    def __init__(self, anki: Anki, note: ANote) -> None:
+    def __init__(
+        self, anki: Anki, note: ANote, suspended: Optional[bool] = None
+    ) -> None:
         self.a = anki
         self.n = note
         note_type = note.note_type()
@@ -50,7 +83,24 @@ class Note:
         else:
             self.model_name = "__invalid-note__"
         self.field_names = list(self.n.keys())
-        self.suspended = any(c.queue == -1 for c in self.n.cards())
+        self._suspended = suspended
+        self._deck: Optional[str] = None
+        self._cards: Optional[list[Card]] = None
+
+    @property
+    def suspended(self) -> bool:
+        """Whether the cards of the note are suspended
+
+        Note: This is looked up on first access, since it requires loading the
+        cards of the note.
+        """
+        if self._suspended is None:
+            self._suspended = any(c.queue == -1 for c in self._get_cards())
+        return self._suspended
+
+    @suspended.setter
+    def suspended(self, value: bool) -> None:
+        self._suspended = value
 
     def __repr__(self) -> str:
         """Convert note to Markdown format"""
@@ -63,12 +113,13 @@ class Note:
         if self.a.n_decks > 1:
             lines += [f"deck: {self.get_deck()}"]
 
-        if not any(check_if_generated_from_markdown(f) for f in self.n.values()):
+        fields = self._get_fields()
+        if not any(is_markdown for _, _, is_markdown in fields):
             lines += ["markdown: false"]
 
         lines += [""]
 
-        for name, field in self.n.items():
+        for name, field, _ in fields:
             lines.append(f"## {name}")
             lines.append(convert_field_to_text(field))
             lines.append("")
@@ -78,7 +129,7 @@ class Note:
     def pprint(self, print_raw: bool = False, list_cards: bool = False) -> None:
         """Print to screen"""
         # pylint: disable=import-outside-toplevel
-        from anki import latex
+        from rich.markdown import Markdown
 
         header = f"[green]# Note (nid: {self.n.id})[/green]"
         if self.suspended:
@@ -86,8 +137,9 @@ class Note:
 
         created = strftime("%F %H:%M", localtime(self.n.id / 1000))
         modified = strftime("%F %H:%M", localtime(self.n.mod))
+        n_cards = len(self._get_cards())
         columned = [
-            f"[yellow]model:[/yellow] {self.model_name} ({len(self.n.cards())} cards)",
+            f"[yellow]model:[/yellow] {self.model_name} ({n_cards} cards)",
             f"[yellow]tags:[/yellow] {self.get_tag_string()}",
             f"[yellow]created:[/yellow] {created}",
             f"[yellow]modified:[/yellow] {modified}",
@@ -98,7 +150,7 @@ class Note:
         if not list_cards:
             flagged = [
                 cards.get_flag(c, str(c.template()["name"]))
-                for c in self.n.cards()
+                for c in self._get_cards()
                 if c.flags > 0
             ]
             if flagged:
@@ -112,8 +164,8 @@ class Note:
 
         console.print()
         imgs: list[Path] = []
-        for name, field in self.n.items():
-            is_markdown = check_if_generated_from_markdown(field)
+        note_type = self.n.note_type()
+        for name, field, is_markdown in self._get_fields():
             if is_markdown:
                 name += " [italic](markdown)[/italic]"
 
@@ -128,11 +180,13 @@ class Note:
                     console.print(text)
             console.print("")
 
-            # Render LaTeX if necessary and fill list of LaTeX images
-            note_type = self.n.note_type()
-            if note_type:
-                latex.render_latex(field, note_type, self.a.col)
-                imgs += img_paths_from_field_latex(field, note_type, self.a)
+            # Render LaTeX if necessary and fill list of LaTeX images. LaTeX is
+            # always written as [latex], [$] or [$$], so skip fields without "["
+            if note_type and "[" in field:
+                latex_imgs = img_paths_from_field_latex(field, note_type, self.a)
+                if not all(self.a.col.media.have(str(img)) for img in latex_imgs):
+                    latex.render_latex(field, note_type, self.a.col)
+                imgs += latex_imgs
 
         if imgs:
             console.print("[blue]## LaTeX sources[/blue]")
@@ -140,6 +194,23 @@ class Note:
                 console.print("- " + str(line))
             console.print("")
 
+    def _get_fields(self) -> list[tuple[str, str, bool]]:
+        """Get name, content and markdown state for each field of the note"""
+        return [
+            (name, field, check_if_generated_from_markdown(field))
+            for name, field in self.n.items()
+        ]
+
+    def _get_cards(self) -> list[Card]:
+        """Get the cards of the note
+
+        Note: The cards are cached, since they are used several times whenever
+        the note is printed. The cache is reset when the cards are changed.
+        """
+        if self._cards is None:
+            self._cards = self.n.cards()
+        return self._cards
+
     def print_cards(self) -> None:
         """Print list of cards to screen"""
         table = Table(
@@ -155,7 +226,7 @@ class Note:
         table.add_column("Reps", justify="right", header_style="white")
         table.add_column("Lapses", justify="right", header_style="white")
         table.add_column("Factor", justify="right", header_style="white")
-        for card in sorted(self.n.cards(), key=lambda x: x.factor):
+        for card in sorted(self._get_cards(), key=lambda x: x.factor):
             table.add_row(
                 "- " + str(card.template()["name"]) + cards.get_flag(card),
                 cards.get_due_days(card, self.a.today),
@@ -224,6 +295,7 @@ class Note:
 
         self.a.col.update_note(self.n)
         self.a.modified = True
+        self._cards = None
         if self.n.dupeOrEmpty():
             console.print("The updated note is now a dupe!")
             console.wait_for_keypress()
@@ -234,7 +306,7 @@ class Note:
 
     def has_consistent_markdown(self) -> bool:
         """Check if markdown fields are consistent with html values"""
-        return any(check_if_inconsistent_markdown(f) for f in self.n.values())
+        return not any(check_if_inconsistent_markdown(f) for f in self.n.values())
 
     def change_model(self) -> Optional[Note]:
         """Change the note type"""
@@ -266,32 +338,42 @@ class Note:
 
             break
 
+        old_fields = self._get_fields()
+        note_data = NoteData(
+            model["name"],
+            " ".join(self.n.tags),
+            self._get_fields_for_model(model, old_fields),
+            any(is_markdown for _, _, is_markdown in old_fields),
+            deck=self.get_deck(),
+        )
+
+        new_note = note_data.add_to_collection(self.a)
+        new_note.edit()
+        self.a.delete_notes(self.n.id)
+
+        return new_note
+
+    def _get_fields_for_model(
+        self, model: NotetypeDict, old_fields: list[tuple[str, str, bool]]
+    ) -> dict[str, str]:
+        """Get the fields of the new note for change_model
+
+        The old fields are all put in the first field of the new model.
+        """
         fields: dict[str, str] = {}
         first_field: str = model["flds"][0]["name"]
         for field in model["flds"]:
             fields[field["name"]] = ""
 
         fields[first_field] = f"Created from Note {self.n.id}\n"
-        for old_field_name, old_field in self.n.items():
+        for old_field_name, old_field, _ in old_fields:
             text = convert_field_to_text(old_field)
             fields[first_field] += f"\n### {old_field_name}\n{text}\n"
 
         if model["name"] == "Cloze":
             fields[first_field] += "\nCloze card needs clozes: {{c1::content}}"
 
-        note_data = NoteData(
-            model["name"],
-            " ".join(self.n.tags),
-            fields,
-            any(check_if_generated_from_markdown(f) for f in self.n.values()),
-            deck=self.get_deck(),
-        )
-
-        new_note = note_data.add_to_collection(self.a)
-        new_note.edit()
-        self.a.delete_notes(self.n.id)
-
-        return new_note
+        return fields
 
     def toggle_marked(self) -> None:
         """Toggle marked tag for note"""
@@ -304,7 +386,7 @@ class Note:
 
     def toggle_suspend(self) -> None:
         """Toggle suspend for note"""
-        cids = [c.id for c in self.n.cards()]
+        cids = self.n.card_ids()
 
         if self.suspended:
             self.a.col.sched.unsuspendCards(cids)
@@ -313,6 +395,7 @@ class Note:
 
         self.suspended = not self.suspended
         self.a.modified = True
+        self._cards = None
 
     def toggle_markdown(self, index: int | None = None) -> None:
         """Toggle markdown on a field"""
@@ -326,7 +409,7 @@ class Note:
 
     def clear_flags(self) -> None:
         """Clear flags for note"""
-        for c in self.n.cards():
+        for c in self._get_cards():
             if c.flags > 0:
                 c.flags = 0
                 c.flush()
@@ -334,7 +417,7 @@ class Note:
 
     def reset_progress(self) -> None:
         """Reset progress for a card"""
-        card_list = {c.template()["name"]: c for c in self.n.cards()}
+        card_list = {c.template()["name"]: c for c in self._get_cards()}
         if len(card_list) <= 1:
             card_name = next(iter(card_list))
         else:
@@ -352,21 +435,40 @@ class Note:
             [card.id], restore_position=True, reset_counts=True
         )
         self.a.modified = True
+        self._cards = None
         console.print("[magenta]The progress was reset.")
         console.wait_for_keypress()
 
     def get_deck(self) -> str:
-        """Return which deck the note belongs to"""
-        return self.a.col.decks.name(self.n.cards()[0].did)
+        """Return which deck the note belongs to
+
+        Note: The deck is cached, since it is shown every time the note is
+        printed. It is reset by set_deck.
+        """
+        if self._deck is None:
+            self._deck = self.a.col.decks.name(self._get_cards()[0].did)
+        return self._deck
 
     def set_deck(self, deck: str) -> None:
         """Move note to deck"""
         newdid = self.a.col.decks.id(deck)
-        cids = [c.id for c in self.n.cards()]
+        cids = self.n.card_ids()
 
         if cids and newdid:
             self.a.col.set_deck(cids, newdid)
             self.a.modified = True
+            self._deck = None
+            self._cards = None
+
+        # Keep the deck lookups up to date if a new deck was created. Note: The
+        # deck name is matched case-insensitively, and parent decks may have
+        # been created as well, so refresh the lookup from the collection.
+        deck_name_to_id = self.a.deck_name_to_id
+        if newdid and newdid not in deck_name_to_id.values():
+            deck_name_to_id.update(
+                (d.name, d.id) for d in self.a.col.decks.all_names_and_ids()
+            )
+            self.a.n_decks = len(deck_name_to_id)
 
     def set_deck_interactive(self) -> None:
         """Move note to deck, interactive"""
@@ -403,28 +505,10 @@ class Note:
         The "remove_actions" argument can be used to remove a default action
         from the action menu.
         """
+        # pylint: disable=import-outside-toplevel
+        import readchar
 
-        actions = {
-            "c": "Continue",
-            "p": "Go back",
-            "e": "Edit",
-            "a": "Add new",
-            "d": "Delete",
-            "m": "Toggle markdown",
-            "*": "Toggle marked",
-            "z": "Toggle suspend",
-            "P": "Toggle pprint",
-            "F": "Clear flags",
-            "R": "Reset progress",
-            "f": "Show images",
-            "E": "Edit CSS",
-            "D": "Change deck",
-            "N": "Change model",
-            "s": "Save and stop",
-            "v": "Show cards",
-            "x": "Save and stop",
-        }
-
+        actions = _REVIEW_ACTIONS
         if remove_actions:
             actions = {
                 key: val for key, val in actions.items() if val not in remove_actions
@@ -462,19 +546,24 @@ class Note:
                 self.pprint(print_raw_fields, list_cards=show_cards)
 
             refresh = True
-            choice = readchar.readchar()
+            # Note: readkey reads escape sequences (e.g. arrow keys) as one key
+            choice = readchar.readkey()
             action = actions.get(choice)
 
+            if action is None:
+                # Nothing changed, so don't redraw the note
+                refresh = False
+                continue
+
+            if self._run_simple_review_action(action):
+                continue
+
             if action == "Continue":
                 return "continue"
 
             if action == "Go back":
                 return "rewind"
 
-            if action == "Edit":
-                self.edit()
-                continue
-
             if action == "Add new":
                 notes = self.a.add_notes_with_editor(
                     tags=self.get_tag_string(),
@@ -492,43 +581,15 @@ class Note:
                 self.delete()
                 return "continue"
 
-            if action == "Toggle markdown":
-                self.toggle_markdown()
-                continue
-
-            if action == "Toggle marked":
-                self.toggle_marked()
-                continue
-
-            if action == "Toggle suspend":
-                self.toggle_suspend()
-                continue
-
             if action == "Toggle pprint":
                 print_raw_fields = not print_raw_fields
                 continue
 
-            if action == "Clear flags":
-                self.clear_flags()
-                continue
-
-            if action == "Reset progress":
-                self.reset_progress()
-                continue
-
             if action == "Show images":
                 self.show_images()
                 refresh = False
                 continue
 
-            if action == "Edit CSS":
-                self.a.edit_model_css(self.model_name)
-                continue
-
-            if action == "Change deck":
-                self.set_deck_interactive()
-                continue
-
             if action == "Change model":
                 new_note = self.change_model()
                 if new_note is not None:
@@ -543,6 +604,28 @@ class Note:
                 show_cards = not show_cards
                 continue
 
+    def _run_simple_review_action(self, action: str) -> bool:
+        """Run a review action that calls a single method
+
+        Returns True if the action was run, after which the note is redrawn.
+        """
+        simple_actions: dict[str, Callable[[], None]] = {
+            "Edit": self.edit,
+            "Toggle markdown": self.toggle_markdown,
+            "Toggle marked": self.toggle_marked,
+            "Toggle suspend": self.toggle_suspend,
+            "Clear flags": self.clear_flags,
+            "Reset progress": self.reset_progress,
+            "Edit CSS": lambda: self.a.edit_model_css(self.model_name),
+            "Change deck": self.set_deck_interactive,
+        }
+
+        if (method := simple_actions.get(action)) is None:
+            return False
+
+        method()
+        return True
+
 
 @dataclass
 class NoteData:
@@ -560,28 +643,29 @@ class NoteData:
         Returns: The new note
         """
         model = anki.set_model(self.model)
-        model_field_names: list[str] = [field["name"] for field in model["flds"]]
+        model_field_names = anki.get_model_field_names(model)
         if len(model_field_names) != len(self.fields):
             console.print(f"Error: Not enough fields for model {self.model}!")
             anki.modified = False
             raise Abort()
 
-        field_names = [x.replace(" (markdown)", "") for x in self.fields.keys()]
-        for x, y in zip(model_field_names, field_names):
-            if x != y:
-                console.print("Warning: Inconsistent field names " f"({x} != {y})")
+        field_names = tuple(x.replace(" (markdown)", "") for x in self.fields.keys())
+        if field_names != model_field_names:
+            for x, y in zip(model_field_names, field_names):
+                if x != y:
+                    console.print("Warning: Inconsistent field names " f"({x} != {y})")
 
-        notetype = anki.col.models.current(for_deck=False)
-        new_note = anki.col.new_note(notetype)
+        new_note = anki.col.new_note(model)
 
-        note_type = new_note.note_type()
-        if self.deck is not None and note_type is not None:
-            note_type["did"] = anki.deck_name_to_id[self.deck]  # type: ignore[has-type]
+        if self.deck is not None:
+            note_type = new_note.note_type()
+            did = anki.deck_name_to_id[self.deck]
+            if note_type is not None and note_type["did"] != did:
+                note_type["did"] = did
 
-        new_note.fields = [
-            convert_text_to_field(f, use_markdown=self.markdown)
-            for f in self.fields.values()
-        ]
+        new_note.fields = convert_texts_to_fields(
+            self.fields.values(), use_markdown=self.markdown
+        )
 
         for tag in self.tags.strip().split():
             new_note.add_tag(tag)
@@ -630,89 +714,89 @@ def _parse_markdown_file(filename: str) -> list[dict[str, Any]]:
         "tags": "",
         "deck": None,
     }
+    # Read the file once, since it is traversed twice. Note that readlines()
+    # splits lines exactly like iterating over the file does.
     with open(filename, "r", encoding="utf8") as f:
-        for line in f:
-            match = re.match(r"#+\s*.*", line)
-            if match:
-                break
+        lines = f.readlines()
+
+    for line in lines:
+        if line.startswith("#"):
+            break
 
-            match = re.match(r"(\w+): (.*)", line)
+        match = _KEY_VALUE_RE.match(line)
+        if match:
+            k, v = match.groups()
+            k = k.lower()
+            v = v.strip()
+            if k in ("tag", "tags"):
+                defaults["tags"] = v.replace(",", "")
+            elif k in ("markdown", "md"):
+                defaults["markdown"] = v in ("true", "yes")
+            else:
+                defaults[k] = v
+
+    notes: list[dict[str, Any]] = []
+    current_note: dict[str, Any] = {}
+    current_field: Optional[str] = None
+    is_in_codeblock = False
+    for line in lines:
+        if is_in_codeblock:
+            if current_field is not None:
+                current_note["fields"][current_field] += line
+            if line.startswith("```") and _CODEBLOCK_END_RE.match(line):
+                is_in_codeblock = False
+            continue
+
+        if line.startswith("```") and _CODEBLOCK_START_RE.match(line):
+            is_in_codeblock = True
+            if current_field is not None:
+                current_note["fields"][current_field] += line
+            continue
+
+        if current_note and current_field is None:
+            match = _KEY_VALUE_RE.match(line)
             if match:
                 k, v = match.groups()
                 k = k.lower()
                 v = v.strip()
                 if k in ("tag", "tags"):
-                    defaults["tags"] = v.replace(",", "")
+                    current_note["tags"] = v.replace(",", "")
                 elif k in ("markdown", "md"):
-                    defaults["markdown"] = v in ("true", "yes")
+                    current_note["markdown"] = v in ("true", "yes")
                 else:
-                    defaults[k] = v
-
-    notes: list[dict[str, Any]] = []
-    current_note: dict[str, Any] = {}
-    current_field: Optional[str] = None
-    is_in_codeblock = False
-    with open(filename, "r", encoding="utf8") as f:
-        for line in f:
-            if is_in_codeblock:
-                if current_field is not None:
-                    current_note["fields"][current_field] += line
-                match = re.match(r"```\s*$", line)
-                if match:
-                    is_in_codeblock = False
-                continue
-
-            match = re.match(r"```\w*\s*$", line)
-            if match:
-                is_in_codeblock = True
-                if current_field is not None:
-                    current_note["fields"][current_field] += line
-                continue
-
-            if current_note and current_field is None:
-                match = re.match(r"(\w+): (.*)", line)
-                if match:
-                    k, v = match.groups()
-                    k = k.lower()
-                    v = v.strip()
-                    if k in ("tag", "tags"):
-                        current_note["tags"] = v.replace(",", "")
-                    elif k in ("markdown", "md"):
-                        current_note["markdown"] = v in ("true", "yes")
-                    else:
-                        current_note[k] = v
-
-            match = re.match(r"(#+)\s*(.*)", line)
-            if not match:
-                if current_field is not None:
-                    current_note["fields"][current_field] += line
-                continue
-
-            level, title = match.groups()
-
-            if len(level) == 1:
-                if current_note and current_field is not None:
-                    current_note["fields"][current_field] = current_note["fields"][
-                        current_field
-                    ].strip()
-                    notes.append(current_note)
-
-                current_note = {"title": title, "fields": {}, **defaults}
-                current_field = None
-                continue
-
-            if len(level) == 2:
-                if current_field is not None:
-                    current_note["fields"][current_field] = current_note["fields"][
-                        current_field
-                    ].strip()
-
-                if title in current_note["fields"]:
-                    console.print(f"Error when parsing {filename}!")
-                    raise Abort()
-
-                current_field = title
-                current_note["fields"][current_field] = ""
+                    current_note[k] = v
+
+        match = _HEADER_RE.match(line) if line.startswith("#") else None
+        if not match:
+            if current_field is not None:
+                current_note["fields"][current_field] += line
+            continue
+
+        level, title = match.groups()
+
+        if len(level) == 1:
+            if current_note and current_field is not None:
+                current_note["fields"][current_field] = current_note["fields"][
+                    current_field
+                ].strip()
+                notes.append(current_note)
+
+            current_note = {"title": title, "fields": {}, **defaults}
+            current_field = None
+            continue
+
+        if len(level) == 2:
+            if current_field is not None:
+                current_note["fields"][current_field] = current_note["fields"][
+                    current_field
+                ].strip()
+
+            if title in current_note["fields"]:
+                console.print(f"Error when parsing {filename}!")
+                raise Abort()
+
+            current_field = title
+            current_note["fields"][current_field] = ""
 
     # Add remaining note to list
     if current_note and current_field is not None:
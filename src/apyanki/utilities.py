@@ -8,8 +8,6 @@ from tempfile import NamedTemporaryFile
 from types import TracebackType
 from typing import Any, Generator, Optional, TypeVar
 
-import readchar
-
 from apyanki.console import console
 
 
@@ -77,12 +75,15 @@ def suppress_stdout() -> Generator[TextIOWrapper, Any, Any]:
 
 def _read_number_between(first: int, last: int) -> int:
     """Read number from user input between first and last (inclusive)"""
+    # pylint: disable=import-outside-toplevel
+    import readchar
+
+    max_digits = len(str(last))
     console.print("> ", end="")
     while True:
         choice_str = ""
         choice_int = 0
         choice_digits = 0
-        max_digits = len(str(last))
 
         while choice_digits < max_digits:
             if choice_digits > 0 and int(choice_str + "0") > last:
@@ -92,9 +93,8 @@ def _read_number_between(first: int, last: int) -> int:
             if char == "\n":
                 break
 
-            try:
-                _ = int(char)
-            except ValueError:
+            # Ignore other keys (these are exactly the characters int() rejects)
+            if not char.isdecimal():
                 continue
 
             next_int = int(choice_str + char)
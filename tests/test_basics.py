@@ -1,7 +1,9 @@
 """Test some basic features"""
 
+from click import Abort
 import pytest
 
+from apyanki.note import NoteData
 from common import testDir, AnkiEmpty, AnkiSimple
 
 pytestmark = pytest.mark.filterwarnings("ignore")
@@ -25,6 +27,19 @@ def test_add_basic():
         assert notes[1].n.note_type()["name"] == "Basic (type in the answer)"
 
 
+def test_add_from_list_is_atomic():
+    """Test that a failing note does not leave a partially added list"""
+    with AnkiEmpty() as a:
+        notes = [
+            NoteData("Basic", "", {"Front": "Question?", "Back": "Answer."}),
+            NoteData("Basic", "", {"Front": "Missing back field"}),
+        ]
+        with pytest.raises(Abort):
+            a.add_notes_from_list(notes)
+
+        assert a.col.note_count() == 0
+
+
 def test_add_different_models():
     """Test adding with different models"""
     with AnkiSimple() as a:
@@ -43,3 +58,15 @@ def test_add_single_with_markdown():
         assert "data-original-markdown" in note.n.fields[0]
         assert "<strong>" in note.n.fields[0]
         assert "<code>" in note.n.fields[1]
+
+
+def test_consistent_markdown():
+    """Test detection of Markdown fields that were changed as HTML"""
+    with AnkiEmpty() as a:
+        note = a.add_notes_single(
+            ["This is **strong** question.", "This is `code` answer."], markdown=True
+        )
+        assert note.has_consistent_markdown()
+
+        note.n.fields[0] = note.n.fields[0].replace("strong", "em")
+        assert not note.has_consistent_markdown()
@@ -20,3 +20,13 @@ def test_change_tags():
 
         a.change_tags(query, "test", add=False)
         assert len(list(a.find_notes(query))) == 0
+
+
+def test_change_tags_from_note_ids():
+    """Test changing tags for a list of note ids"""
+    with AnkiSimple() as a:
+        a.add_notes_from_file(testDir + "/" + "data/deck.md")
+
+        note_ids = a.col.find_notes("tag:test")
+        a.change_tags(note_ids, "testendret")
+        assert len(a.col.find_notes("tag:testendret")) == len(note_ids)
@@ -28,3 +28,5 @@ def test_decks():
         assert notes[1].get_deck() == "DeckTwo"
 
         assert a.col.decks.count() == 3
+        assert "DeckTwo" in a.deck_names
+        assert a.n_decks == 3
@@ -0,0 +1,46 @@
+"""Test field conversions"""
+
+import pytest
+
+from apyanki.fields import (
+    check_if_generated_from_markdown,
+    convert_field_to_text,
+    convert_text_to_field,
+)
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+
+def test_check_if_generated_from_markdown():
+    """Test detection of fields that were generated from Markdown"""
+    field = convert_text_to_field("This is **strong**.", use_markdown=True)
+    assert check_if_generated_from_markdown(field)
+    assert check_if_generated_from_markdown("\n" + field)
+
+    assert not check_if_generated_from_markdown("This is plain text.")
+    assert not check_if_generated_from_markdown("<p>This is <b>html</b>.</p>")
+    assert not check_if_generated_from_markdown(
+        '<div>Nested <p data-original-markdown="Zm9v">foo</p></div>'
+    )
+
+
+def test_check_if_generated_from_markdown_with_comment():
+    """Test detection of generated fields that start with a comment"""
+    field = convert_text_to_field("This is **strong**.", use_markdown=True)
+    assert check_if_generated_from_markdown("<!-- comment -->" + field)
+    assert not check_if_generated_from_markdown(
+        '<!-- comment --><div>Nested <p data-original-markdown="Zm9v">foo</p></div>'
+    )
+
+
+def test_convert_plain_text_to_field():
+    """Test conversion of plain text with HTML entities"""
+    field = convert_text_to_field("a &lt; b &amp;&gt; c\n&amp;nbsp;d", False)
+    assert field == "a < b &> c<br /> d"
+
+
+def test_convert_markdown_field_to_text():
+    """Test extraction of the original Markdown from a field"""
+    text = "This is **strong**.\n\n* and a list"
+    field = convert_text_to_field(text, use_markdown=True)
+    assert convert_field_to_text(field) == text